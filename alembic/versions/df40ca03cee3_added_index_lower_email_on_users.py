@@ -0,0 +1,50 @@
+"""Added index lower(email) on users
+
+Revision ID: df40ca03cee3
+Revises: 24ab2b4904fa
+Create Date: 2026-10-15 23:10:12.204118
+
+Existing emails are normalized to lower(trim(email)) before the index is
+created. If two users differ only by case or surrounding spaces, the upgrade
+stops and lists them; merge or delete the duplicate accounts manually (e.g.
+keep the confirmed one, reassign its posts, comments and likes) and rerun.
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'df40ca03cee3'
+down_revision: Union[str, Sequence[str], None] = '24ab2b4904fa'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    # Normalizing would violate uq_users_email for these, so fail with a clear message instead
+    collisions = bind.execute(sa.text(
+        "SELECT lower(trim(email)) AS normalized, count(*) AS total FROM users"
+        " WHERE email IS NOT NULL"
+        " GROUP BY lower(trim(email)) HAVING count(*) > 1"
+    )).all()
+    if collisions:
+        emails = ", ".join(f"{row.normalized} ({row.total} users)" for row in collisions)
+        raise RuntimeError(
+            "Cannot normalize users.email, these emails differ only by case or spaces: "
+            f"{emails}. Merge or delete the duplicate users and rerun the migration."
+        )
+
+    op.execute(sa.text(
+        "UPDATE users SET email = lower(trim(email)) WHERE email <> lower(trim(email))"
+    ))
+    op.create_index('ix_users_email_lower', 'users', [sa.text('lower(email)')], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_users_email_lower', table_name='users')
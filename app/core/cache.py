@@ -0,0 +1,50 @@
+"""Small in-process caches shared by the routers."""
+import threading
+from collections import OrderedDict
+from collections.abc import Hashable
+
+
+class LRUCache[K: Hashable, V]:
+    """Thread-safe bounded LRU cache.
+
+    Used for hot-path results that are expensive to recompute (password
+    verification, JWT decoding). Entries beyond ``maxsize`` evict the least
+    recently used one.
+
+    Attributes:
+        maxsize: Maximum number of entries kept in the cache
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._data: OrderedDict[K, V] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: K) -> V | None:
+        """Return the cached value for key (marking it recently used), or None."""
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key: K, value: V) -> None:
+        """Store value for key, evicting the oldest entry when full."""
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: K) -> None:
+        """Remove key from the cache if present."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """Remove all entries."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -93,6 +93,9 @@ class GlobalConfig(BaseConfig):
         JWT_ALGORITHM: Algorithm for JWT signing
         ACCESS_TOKEN_EXPIRE_MINUTES: Access token expiration time in minutes
         CONFIRM_TOKEN_EXPIRE_MINUTES: Confirmation token expiration time in minutes
+        ARGON2_TIME_COST: Argon2id iterations used when hashing passwords
+        ARGON2_MEMORY_COST: Argon2id memory usage in KiB
+        ARGON2_PARALLELISM: Argon2id number of parallel lanes
         MAILGUN_API_KEY: Mailgun API key for email service
         MAILGUN_DOMAIN: Mailgun domain for email service
         B2_KEY_ID: Backblaze B2 key ID for object storage
@@ -116,6 +119,15 @@ class GlobalConfig(BaseConfig):
     CONFIRM_TOKEN_EXPIRE_MINUTES: int = Field(
         default=60, ge=1, description="Confirm Token expiration time in minutes"
     )
+    ARGON2_TIME_COST: int = Field(
+        default=3, ge=1, description="Argon2id iterations for password hashing"
+    )
+    ARGON2_MEMORY_COST: int = Field(
+        default=64 * 1024, ge=8, description="Argon2id memory usage in KiB"
+    )
+    ARGON2_PARALLELISM: int = Field(
+        default=1, ge=1, description="Argon2id number of parallel lanes"
+    )
 
     # MailGun
     MAILGUN_API_KEY: str | None = None
@@ -332,11 +344,15 @@ class TestConfig(GlobalConfig):
     """Test environment configuration.
 
     Uses TEST_ prefix for environment variables. Forces rollback after each
-    request and uses a separate test database (test.db).
+    request, uses a separate test database (test.db) and the cheapest Argon2id
+    parameters so password hashing does not dominate the test suite.
     """
 
     model_config = SettingsConfigDict(env_prefix="TEST_", extra="ignore")
     DB_FORCE_ROLLBACK: bool = True
+    JWT_SECRET_KEY: str = "test-secret-key-for-hs256-signing"
+    ARGON2_TIME_COST: int = 1
+    ARGON2_MEMORY_COST: int = 8
 
     @property
     def SQLALCHEMY_DATABASE_URI(self) -> str:
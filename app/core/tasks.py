@@ -6,6 +6,27 @@ from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Shared outbound client, so Mailgun calls reuse pooled keep-alive connections
+HTTP_LIMITS = httpx.Limits(max_keepalive_connections=20, max_connections=100)
+HTTP_TIMEOUT = httpx.Timeout(5.0)
+_http_client: httpx.AsyncClient | None = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared outbound HTTP client, creating it on first use."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """Close the shared outbound HTTP client (called on application shutdown)."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
 
 async def send_simple_message(
     to: str,
@@ -54,15 +75,14 @@ async def send_simple_message(
     logger.info(f"Mailgun data: {data}")
 
     try:
-        async with httpx.AsyncClient() as client:  # default timeout of 5.0 seconds
-            response = await client.post(url, auth=auth, data=data)
+        response = await get_http_client().post(url, auth=auth, data=data)
 
-            # Raises httpx.HTTPStatusError if 4xx/5xx
-            response.raise_for_status()
+        # Raises httpx.HTTPStatusError if 4xx/5xx
+        response.raise_for_status()
 
-            result = response.json()
-            logger.info(f"Email sent successfully via Mailgun", extra={"to": to, "message_id": result.get("id")})
-            return result
+        result = response.json()
+        logger.info(f"Email sent successfully via Mailgun", extra={"to": to, "message_id": result.get("id")})
+        return result
 
     except httpx.HTTPStatusError as exc:
         # Mailgun returned an error (400/401/500 etc)
@@ -1,5 +1,5 @@
 """SQLAlchemy ORM models using SQLAlchemy 2.0 style."""
-from sqlalchemy import ForeignKey, String, Boolean
+from sqlalchemy import ForeignKey, Index, String, Boolean, func
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
@@ -77,6 +77,12 @@ class User(Base):
     confirmed: Mapped[bool] = mapped_column(Boolean, default=False)
 
 
+# Emails are stored lowercased and looked up by equality (served by
+# uq_users_email); this index is only a guard that rejects case-only
+# duplicates written by anything that bypasses the router
+Index("ix_users_email_lower", func.lower(User.email), unique=True)
+
+
 class Like(Base):
     """Like model
 
@@ -13,10 +13,11 @@ from fastapi.responses import JSONResponse
 from app.core.config import DevConfig, settings
 from app.core.config_logging import configure_logging
 from app.core.database import engine
+from app.core.tasks import close_http_client
 from app.entities.models import Base
 
 from app.routers.post import router as post_router
-from app.routers.user import router as user_router
+from app.routers.user import router as user_router, refill_salt_pool
 from app.routers.bucket import router as bucket_router
 
 logger = logging.getLogger(__name__)
@@ -38,13 +39,18 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
 
     Handles startup and shutdown tasks:
     - Configures logging
+    - Pre-generates password salts
+    - Builds the OpenAPI schema, so the first /docs request doesn't pay for it
     - Creates database tables in development mode
-    - Disposes database engine on shutdown
+    - Disposes database engine and closes the shared HTTP client on shutdown
 
     Note: Table creation should be replaced with Alembic migrations in production.
     """
     configure_logging()
     logger.info("Application starting up...", extra={"email": "test_email@gmail.com"})
+    await refill_salt_pool()
+    # FastAPI caches the schema on the app after the first call
+    app.openapi()
 
     # Auto-create tables in local development to speed up iteration.
     # This should NOT be used in production; prefer Alembic migrations.
@@ -84,6 +90,7 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
     # Shutdown: dispose database engine
     logger.info("Application shutting down...")
     await engine.dispose()
+    await close_http_client()
     logger.info("Application shutdown complete")
 
 
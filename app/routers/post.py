@@ -3,7 +3,8 @@ from enum import Enum
 import logging
 from typing import Annotated
 
-from fastapi import APIRouter, HTTPException, status, Depends, Path, Request
+from fastapi import APIRouter, HTTPException, status, Depends, Path, Request, Response
+from pydantic import TypeAdapter
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, desc, asc
 
@@ -34,6 +35,10 @@ select_post_and_likes = (
     .group_by(Post.id)
 )
 
+# JSON serializers for the list endpoints, built once at import time
+posts_json_adapter = TypeAdapter(list[UserPost])
+comments_json_adapter = TypeAdapter(list[Comment])
+
 
 # Dependencies
 async def get_post_by_id(
@@ -120,7 +125,6 @@ async def create_post(
     new_post = Post(**post.model_dump(), user_id=current_user.id)
     session.add(new_post)
     await session.commit()
-    await session.refresh(new_post)
     logger.debug(f"Created post with id={new_post.id}")
     return _convert_post_to_entity(new_post)
 
@@ -140,8 +144,12 @@ class PostSorting(str, Enum):
 async def get_posts(
     session: Annotated[AsyncSession, Depends(get_async_session)],
     sorting: PostSorting = PostSorting.new
-) -> list[UserPost]:
-    """Get all posts."""
+) -> Response:
+    """Get all posts.
+
+    The response is encoded directly with a prebuilt serializer, skipping
+    FastAPI's per-request validation of the response model.
+    """
     logger.info("Fetching all posts")
     # query = select(Post)
     if sorting == PostSorting.new:
@@ -159,7 +167,8 @@ async def get_posts(
     result = await session.execute(query)
     posts = result.scalars().all()
     logger.debug(f"Found {len(posts)} posts")
-    return [_convert_post_to_entity(post) for post in posts]
+    content = posts_json_adapter.dump_json([_convert_post_to_entity(post) for post in posts])
+    return Response(content=content, media_type="application/json")
 
 
 # Comment endpoints
@@ -171,13 +180,17 @@ async def get_posts(
 )
 async def get_comments(
     session: Annotated[AsyncSession, Depends(get_async_session)],
-) -> list[Comment]:
-    """Get all comments."""
+) -> Response:
+    """Get all comments.
+
+    Encoded with a prebuilt serializer, like get_posts.
+    """
     logger.info("Fetching all comments")
     result = await session.execute(select(CommentORM))
     comments = result.scalars().all()
     logger.debug(f"Found {len(comments)} comments")
-    return [_convert_comment_to_entity(comment) for comment in comments]
+    content = comments_json_adapter.dump_json([_convert_comment_to_entity(comment) for comment in comments])
+    return Response(content=content, media_type="application/json")
 
 
 @router.post(
@@ -212,7 +225,6 @@ async def create_comment(
     new_comment = CommentORM(**comment.model_dump(), user_id=current_user.id)
     session.add(new_comment)
     await session.commit()
-    await session.refresh(new_comment)
     logger.debug(f"Created comment with id={new_comment.id}")
     return _convert_comment_to_entity(new_comment)
 
@@ -308,6 +320,5 @@ async def like_post(
     new_post_like = Like(**post_like.model_dump(), user_id=current_user.id)
     session.add(new_post_like)
     await session.commit()
-    await session.refresh(new_post_like)
     logger.debug(f"Created post like with id={new_post_like.id}")
     return _convert_post_like_to_entity(new_post_like)
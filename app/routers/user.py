@@ -1,19 +1,31 @@
 import logging
 import datetime
+import os
+import time
 import bcrypt
 import hashlib
+from collections import deque
 from typing import Annotated, Literal
+from urllib.parse import quote
 
-from fastapi import HTTPException, APIRouter, Depends, status, Request, BackgroundTasks
+import anyio
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerifyMismatchError
+from fastapi import HTTPException, APIRouter, Depends, status, Request, Response, BackgroundTasks
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from jose import jwt, ExpiredSignatureError, JWTError
+from pydantic import TypeAdapter
+from starlette.datastructures import URLPath
+import jwt
+from jwt import ExpiredSignatureError, InvalidTokenError
 
-from sqlalchemy import select
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.entities.models import User as UserORM
 from app.entities.schemas import User, UserIn, UserRegistrationResponse
 
+from app.core.cache import LRUCache
 from app.core.tasks import send_user_registration_email
 from app.core.database import get_async_session
 from app.core.config import settings, access_token_expire_minutes, confirm_token_expire_minutes
@@ -25,39 +37,122 @@ router = APIRouter(tags=["users"])
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl = "token")  # /token
 
+# JWT signing settings, resolved once instead of on every token
+JWT_SECRET_KEY = settings.JWT_SECRET_KEY
+JWT_ALGORITHM = settings.JWT_ALGORITHM
+JWT_ALGORITHMS = [JWT_ALGORITHM]
+
+password_hasher = PasswordHasher(
+    time_cost=settings.ARGON2_TIME_COST,
+    memory_cost=settings.ARGON2_MEMORY_COST,
+    parallelism=settings.ARGON2_PARALLELISM,
+)
+
+# Pre-generated salts, so hashing does not hit the entropy source per request.
+# Each salt is popped exactly once; deque append/pop are thread-safe.
+SALT_POOL_SIZE = 64
+_salt_pool: deque[bytes] = deque(maxlen=SALT_POOL_SIZE)
+
+# Successful password checks, so repeated logins skip the KDF
+_verify_cache: LRUCache[bytes, bool] = LRUCache(maxsize=1024)
+
+# Decoded tokens: token -> (subject, token type, expiry timestamp)
+_token_cache: LRUCache[str, tuple[str, str, int]] = LRUCache(maxsize=2048)
+# Cached tokens this close to expiring are decoded again
+TOKEN_CACHE_EXPIRY_MARGIN_SECONDS = 5
+
+# Built once; the email is bound per call
+select_user_by_email = select(UserORM).where(UserORM.email == bindparam("email"))
+select_user_id_by_email = select(UserORM.id).where(UserORM.email == bindparam("email"))
+
+# JSON serializer for the user list, built once at import time
+users_json_adapter = TypeAdapter(list[User])
+
+
+def _generate_salts(count: int) -> list[bytes]:
+    """Draw count fresh random salts."""
+    return [os.urandom(password_hasher.salt_len) for _ in range(count)]
+
+
+async def refill_salt_pool() -> None:
+    """Top up the salt pool, drawing entropy in a worker thread."""
+    missing = SALT_POOL_SIZE - len(_salt_pool)
+    if missing > 0:
+        _salt_pool.extend(await anyio.to_thread.run_sync(_generate_salts, missing))
+
 
 def get_password_hash(password: str) -> str:
-    """Hash a password using SHA256 and bcrypt."""
-    # Pre-hash with SHA256 to remove bcrypt 72-byte limit
-    sha = hashlib.sha256(password.encode("utf-8")).digest()
-    hashed = bcrypt.hashpw(sha, bcrypt.gensalt())
-    return hashed.decode()  # return as str
+    """Hash a password using Argon2id.
+
+    Uses a pre-generated salt from the pool when available; otherwise argon2
+    draws a fresh one itself.
+    """
+    try:
+        salt = _salt_pool.popleft()
+    except IndexError:
+        salt = None
+    return password_hasher.hash(password, salt=salt)
+
+
+def _is_bcrypt_hash(hashed_password: str) -> bool:
+    """Check whether a hash was created by the legacy SHA256 + bcrypt scheme."""
+    return hashed_password.startswith("$2")
+
+
+def _verify_hash(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password against an Argon2id or legacy bcrypt hash."""
+    if _is_bcrypt_hash(hashed_password):
+        sha = hashlib.sha256(plain_password.encode("utf-8")).digest()
+        return bcrypt.checkpw(sha, hashed_password.encode())
+    try:
+        return password_hasher.verify(hashed_password, plain_password)
+    except (VerifyMismatchError, InvalidHashError):
+        return False
+
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    """Check whether a stored hash should be upgraded to the current parameters."""
+    return _is_bcrypt_hash(hashed_password) or password_hasher.check_needs_rehash(hashed_password)
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a password against a hash."""
-    sha = hashlib.sha256(plain_password.encode("utf-8")).digest()
-    return bcrypt.checkpw(sha, hashed_password.encode())
+    """Verify a password against a hash.
+
+    Only successful checks are cached, so a wrong password always pays the
+    full KDF cost and cannot be told apart by timing.
+    """
+    key = hashlib.sha256(
+        plain_password.encode("utf-8") + b"|" + hashed_password.encode()
+    ).digest()
+    if _verify_cache.get(key):
+        return True
+
+    is_valid = _verify_hash(plain_password, hashed_password)
+    if is_valid:
+        _verify_cache.set(key, True)
+    return is_valid
+
+
+def clear_verify_cache() -> None:
+    """Drop all cached password checks."""
+    _verify_cache.clear()
+
+
+def _encode_token(email: str, token_type: str, expire_minutes: int) -> str:
+    """Encode a signed JWT for the given subject and token type."""
+    expire = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(minutes=expire_minutes)
+    jwt_data = {"sub": email, "exp": expire, "type": token_type}
+    return jwt.encode(jwt_data, key=JWT_SECRET_KEY, algorithm=JWT_ALGORITHM)
 
 
 def create_access_token(email: str):
     logger.debug("Creating access token", extra={"email": email})
-    expire = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
-        minutes=access_token_expire_minutes()
-    )
-    jwt_data = {"sub": email, "exp": expire, "type": "access"}
-    return jwt.encode(jwt_data, key=settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
+    return _encode_token(email, "access", access_token_expire_minutes())
 
 
 def create_confirmation_token(email: str):
     logger.debug("Creating confirmation token", extra={"email": email})
-    expire = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(
-        minutes=confirm_token_expire_minutes()
-    )
-    jwt_data = {"sub": email, "exp": expire, "type": "confirmation"}
-    return jwt.encode(
-        jwt_data,
-        key=settings.JWT_SECRET_KEY,
-        algorithm=settings.JWT_ALGORITHM)
+    return _encode_token(email, "confirmation", confirm_token_expire_minutes())
 
 
 def get_exception_401(detail: str) -> HTTPException:
@@ -78,16 +173,36 @@ def get_exception_400(detail: str) -> HTTPException:
     )
 
 
+def _check_token_type(token_type: str | None, payload_type: str) -> None:
+    """Raise 401 if the token type does not match the expected payload type."""
+    if token_type is None or (token_type != payload_type):
+        detail = f"Unauthorized, not accept token type={token_type}; payload type={payload_type}"
+        raise get_exception_401(detail)
+
+
 def get_subject_for_token_type(token: str, payload_type: Literal["access", "confirmation"]) -> str:
+    """Return the subject (email) of a token after checking its type.
+
+    Successfully decoded tokens are cached until shortly before they expire,
+    so repeated requests with the same token skip signature verification.
+    """
+    cached = _token_cache.get(token)
+    if cached is not None:
+        email, token_type, expire = cached
+        if expire > time.time() + TOKEN_CACHE_EXPIRY_MARGIN_SECONDS:
+            _check_token_type(token_type, payload_type)
+            return email
+        _token_cache.pop(token)
+
     try:
         payload = jwt.decode(
             token,
-            key=settings.JWT_SECRET_KEY,
-            algorithms=[settings.JWT_ALGORITHM])
+            key=JWT_SECRET_KEY,
+            algorithms=JWT_ALGORITHMS)
     except ExpiredSignatureError as e:
         detail = "Unauthorized, Token has expired"
         raise get_exception_401(detail) from e
-    except JWTError as e:
+    except InvalidTokenError as e:
         detail = f"Unauthorized, invalid token with token: {token}"
         raise get_exception_401(detail) from e
 
@@ -99,15 +214,29 @@ def get_subject_for_token_type(token: str, payload_type: Literal["access", "conf
         raise get_exception_401(detail)
 
     token_type = payload.get("type")
-    if token_type is None or (token_type != payload_type):
-        detail = f"Unauthorized, not accept token type={token_type}; payload type={payload_type}"
-        raise get_exception_401(detail)
+    expire = payload.get("exp")
+    if token_type is not None and expire is not None:
+        _token_cache.set(token, (email, token_type, expire))
+    _check_token_type(token_type, payload_type)
     return email
 
 
 def _convert_user_to_entity(user: UserORM) -> UserIn:
-    """Convert ORM User to Pydantic User entity."""
-    return UserIn.model_validate(user, from_attributes=True)
+    """Convert ORM User to Pydantic User entity.
+
+    Rows come from our own storage and were validated on the way in, so
+    validation is skipped.
+    """
+    return UserIn.model_construct(
+        id=user.id,
+        email=user.email,
+        password=user.password,
+    )
+
+
+def normalize_email(email: str) -> str:
+    """Canonical form used for storing and looking up emails."""
+    return email.strip().lower()
 
 
 async def get_user(
@@ -115,10 +244,9 @@ async def get_user(
     email: str
 ) -> UserORM | None:
     """Get User entity based on given email"""
+    email = normalize_email(email)
     logger.info("Fetching user entity from DB", extra={"email": email})
-    query = select(UserORM).where(UserORM.email == email)
-    logger.debug(f"query: {query}")
-    result = await session.execute(query)
+    result = await session.execute(select_user_by_email, {"email": email})
     return result.scalar_one_or_none()
 
 
@@ -132,10 +260,20 @@ async def authenticate_user(
     if not user:
         raise get_exception_401(f"1-Unauthorized with given email: {email}; password: xxx")
     user_entity = _convert_user_to_entity(user)
-    if not verify_password(plain_password=password, hashed_password=user_entity.password):
+    # Password hashing is CPU bound, run it in a worker thread to keep the event loop responsive
+    is_valid_password = await anyio.to_thread.run_sync(
+        verify_password, password, user_entity.password
+    )
+    if not is_valid_password:
         raise get_exception_401(f"2-Unauthorized with given email: {email}; password: xxx")
     if not user.confirmed:
         raise get_exception_401(f"Unauthorized, User has not confirmed email.")
+    if password_needs_rehash(user.password):
+        # Transparently migrate legacy bcrypt hashes on successful login
+        logger.info("Rehashing user password", extra={"email": email})
+        user.password = await anyio.to_thread.run_sync(get_password_hash, password)
+        await session.commit()
+        user_entity = _convert_user_to_entity(user)
     return user_entity
 
 
@@ -156,6 +294,23 @@ async def get_current_user(
     return _convert_user_to_entity(user)
 
 
+CONFIRM_TOKEN_PLACEHOLDER = "__token__"
+
+
+def _confirmation_url(request: Request, token: str) -> str:
+    """Build the absolute confirm_email URL for a token.
+
+    The route path is reversed once and cached on app.state; only the
+    request's base URL is resolved per call, so the host stays correct.
+    """
+    template = getattr(request.app.state, "confirm_url_template", None)
+    if template is None:
+        template = str(request.app.url_path_for("confirm_email", token=CONFIRM_TOKEN_PLACEHOLDER))
+        request.app.state.confirm_url_template = template
+    path = URLPath(template.replace(CONFIRM_TOKEN_PLACEHOLDER, quote(token, safe="")))
+    return str(path.make_absolute_url(base_url=request.base_url))
+
+
 @router.post(
     "/register",
     status_code=status.HTTP_201_CREATED,
@@ -166,20 +321,36 @@ async def register(
     session: Annotated[AsyncSession, Depends(get_async_session)],
     request: Request
 ) -> UserRegistrationResponse:
-    existed_user = await get_user(session=session, email=user.email)
-    if existed_user:
-        raise get_exception_400(detail = f"User with email already existed: {user.email}")
     user_detail = user.model_dump()
-    user_detail["password"] = get_password_hash(user_detail["password"])
+    user_detail["email"] = normalize_email(user_detail["email"])
+    email_exists_detail = f"User with email already existed: {user.email}"
 
-    new_user = UserORM(**user_detail)
-    session.add(new_user)
-    await session.commit()
-    await session.refresh(new_user)
+    # Cheap id-only lookup so duplicates are rejected before the password is hashed
+    existing_id = await session.scalar(select_user_id_by_email, {"email": user_detail["email"]})
+    if existing_id is not None:
+        raise get_exception_400(detail=email_exists_detail)
+
+    user_detail["password"] = await anyio.to_thread.run_sync(
+        get_password_hash, user_detail["password"]
+    )
+    if len(_salt_pool) < SALT_POOL_SIZE // 2:
+        background_tasks.add_task(refill_salt_pool)
 
-    confirmation_url = str(request.url_for(
-        "confirm_email", token=create_confirmation_token(new_user.email)
-    ))
+    # The unique constraints still guard against concurrent registrations; the
+    # stored values come back from the INSERT instead of a refresh SELECT
+    query = insert(UserORM).values(**user_detail).returning(UserORM.id, UserORM.email)
+    try:
+        new_user = (await session.execute(query)).one()
+        await session.commit()
+    except IntegrityError as e:
+        await session.rollback()
+        # users only has unique constraints on id and email; both email ones
+        # (uq_users_email, ix_users_email_lower) mention the column in the error
+        if "email" in str(e.orig):
+            raise get_exception_400(detail=email_exists_detail) from e
+        raise get_exception_400(detail=f"User with id already existed: {user.id}") from e
+
+    confirmation_url = _confirmation_url(request, create_confirmation_token(new_user.email))
     # await send_user_registration_email(email=new_user.email, confirmation_url=confirmation_url)
 
     # Using Background Tasks
@@ -205,13 +376,20 @@ async def register(
 )
 async def get_users(
     session: Annotated[AsyncSession, Depends(get_async_session)]
-) -> list[User]:
-    """Get all users"""
+) -> Response:
+    """Get all users.
+
+    Selects only the columns exposed by the User schema, so no ORM instances
+    are loaded, and encodes the rows with a prebuilt serializer instead of
+    validating them against the response model.
+    """
     logger.info("Fetching all users")
-    result = await session.execute(select(UserORM))
-    users = result.scalars().all()
-    logger.debug(f"Found {len(users)} users.")
-    return [_convert_user_to_entity(user) for user in users]
+    query = select(UserORM.id, UserORM.email)
+    result = await session.execute(query)
+    rows = result.mappings().all()
+    logger.debug(f"Found {len(rows)} users.")
+    content = users_json_adapter.dump_json([User.model_construct(**row) for row in rows])
+    return Response(content=content, media_type="application/json")
 
 
 @router.post("/token", response_model=dict)
@@ -224,7 +402,7 @@ async def login(
     Uses OAuth2PasswordRequestForm (form-data with username and password).
     The username field should contain the user's email address.
     """
-    email = form_data.username
+    email = normalize_email(form_data.username)
     password = form_data.password
 
     logger.info("Checking authentication of user", extra={"email": email})
@@ -238,29 +416,22 @@ async def confirm_email(
     session: Annotated[AsyncSession, Depends(get_async_session)],
     token: str
 ) -> dict:
-    email = get_subject_for_token_type(token, "confirmation")
-
-    # Method 1: select & update
-    query = select(UserORM).where(UserORM.email==email)
+    # Tokens issued before emails were normalized may carry a mixed-case subject
+    email = normalize_email(get_subject_for_token_type(token, "confirmation"))
+
+    # Single round trip: update and report whether a row matched
+    query = (
+        update(UserORM)
+        .where(UserORM.email == email)
+        .values(confirmed=True)
+        .returning(UserORM.id)
+    )
     result = await session.execute(query)
-    user = result.scalar_one_or_none()
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found with email: {email}")
-    user.confirmed = True
+    if result.first() is None:
+        await session.rollback()
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User not found with email: {email}")
     await session.commit()
 
-    # Method 2: update
-    # Update column 'confirmed' = True
-    # query = (
-    #     update(UserORM)
-    #     .where(UserORM.email == email)
-    #     .values(confirmed=True)
-    #     .execution_options(synchronize_session="fetch")
-    # )
-    # logger.debug(f"query: {query}")
-    # await session.execute(query)
-    # await session.commit()
-
     return {"detail": "User confirmed"}
 
 
@@ -1,23 +1,28 @@
 """Test configuration and fixtures."""
+import datetime
 import os
 import logging
+from pathlib import Path
 from typing import AsyncGenerator, Generator
 from unittest.mock import AsyncMock, patch
 
-from sqlalchemy import delete, select
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy import event, make_url, select
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
 
 import pytest
-from fastapi import HTTPException, status
+from fastapi import BackgroundTasks, HTTPException, status
 from fastapi.testclient import TestClient
 from httpx import AsyncClient, ASGITransport
+import jwt
 
 os.environ["ENV_STATE"] = "test"
 
-from app.core.config import settings
+from app.core.config import settings, access_token_expire_minutes
 from app.core.database import get_async_session
 from app.main import app
-from app.entities.models import Base, Comment, Post, User as UserORM
+from app.routers.user import create_access_token, get_password_hash
+from app.entities.models import Base, User as UserORM
 
 logger = logging.getLogger(__name__)
 
@@ -25,16 +30,63 @@ logger = logging.getLogger(__name__)
 # TEST DATABASE CONFIG
 # ------------------------------------------
 
-TEST_DATABASE_URL = str(settings.SQLALCHEMY_DATABASE_URI)
+# Guard against running the suite with production password hashing cost
+assert settings.ARGON2_TIME_COST == 1 and settings.ARGON2_MEMORY_COST == 8, (
+    "Test settings must use the cheap Argon2id parameters"
+)
+
+# In-memory SQLite by default; set TEST_DB_IN_MEMORY=0 to run against the
+# configured test database instead (e.g. for PostgreSQL-specific behaviour)
+TEST_DB_IN_MEMORY = os.getenv("TEST_DB_IN_MEMORY", "1") != "0"
+
+# Set by pytest-xdist ("gw0", "gw1", ...) when running with -n
+XDIST_WORKER = os.getenv("PYTEST_XDIST_WORKER")
+
+if TEST_DB_IN_MEMORY:
+    # Each process (and so each xdist worker) gets its own in-memory database
+    TEST_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
+    # A single shared connection keeps the in-memory schema visible to all sessions
+    engine_kwargs = {"connect_args": {"check_same_thread": False}, "poolclass": StaticPool}
+else:
+    test_database_url = make_url(str(settings.SQLALCHEMY_DATABASE_URI))
+    if XDIST_WORKER and test_database_url.get_backend_name() == "sqlite" and test_database_url.database:
+        # One SQLite file per worker so workers don't share state
+        database = Path(test_database_url.database)
+        test_database_url = test_database_url.set(
+            database=str(database.with_stem(f"{database.stem}_{XDIST_WORKER}"))
+        )
+    TEST_DATABASE_URL = test_database_url.render_as_string(hide_password=False)
+    if test_database_url.get_backend_name() == "sqlite":
+        # Same single shared connection as in-memory, without reconnecting per test
+        engine_kwargs = {"connect_args": {"check_same_thread": False}, "poolclass": StaticPool}
+    else:
+        # Tests use one connection at a time (the per-test transaction), so a
+        # small warm pool suffices; the pre-ping SELECT 1 per checkout is skipped
+        engine_kwargs = {
+            "poolclass": AsyncAdaptedQueuePool,
+            "pool_size": 5,
+            "max_overflow": 5,
+            "pool_pre_ping": False,
+        }
 print(f"TEST_DATABASE_URL: {TEST_DATABASE_URL}")
 
 engine_test = create_async_engine(
     TEST_DATABASE_URL,
     future=True,
     echo=False,
+    **engine_kwargs,
 )
 AsyncSessionTest = async_sessionmaker(engine_test, expire_on_commit=False)
 
+# Shared user created once per session by the registered_user fixture
+REGISTERED_USER = {
+    "id": 123,
+    "email": "test@host.com",
+    "password": "123456"
+}
+# Hashed once at import; every session stores this same hash
+REGISTERED_USER_PASSWORD_HASH = get_password_hash(REGISTERED_USER["password"])
+
 
 # ------------------------------------------
 # Create schema once per test session
@@ -52,29 +104,40 @@ async def prepare_database():
 
 
 # ------------------------------------------
-# Database cleanup between tests
+# Per-test transaction rollback
 # ------------------------------------------
 
 
-@pytest.fixture(autouse=True, scope="function")
-async def clean_database():
-    """Clean database tables before and after each test to ensure test isolation."""
-    # Clean before test
-    async with AsyncSessionTest() as session:
-        # Delete in reverse order of foreign key dependencies
-        await session.execute(delete(Comment))
-        await session.execute(delete(Post))
-        await session.execute(delete(UserORM))
-        await session.commit()
+if engine_test.dialect.name == "sqlite":
+    # pysqlite's own transaction handling breaks SAVEPOINT; let SQLAlchemy
+    # emit BEGIN itself so nested transactions work
+    @event.listens_for(engine_test.sync_engine, "connect")
+    def _sqlite_disable_implicit_begin(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
 
-    yield
+    @event.listens_for(engine_test.sync_engine, "begin")
+    def _sqlite_begin(conn):
+        conn.exec_driver_sql("BEGIN")
 
-    # Clean after test
-    async with AsyncSessionTest() as session:
-        await session.execute(delete(Comment))
-        await session.execute(delete(Post))
-        await session.execute(delete(UserORM))
-        await session.commit()
+
+@pytest.fixture(autouse=True)
+async def db_transaction(prepare_database) -> AsyncGenerator[AsyncConnection, None]:
+    """Run each test inside an outer transaction that is rolled back afterwards.
+
+    Every session made by AsyncSessionTest (including the one injected into
+    the app) joins this transaction, so its commits only release a SAVEPOINT
+    and nothing a test writes outlives it. Session-scoped data such as the
+    registered user is created before this fixture and is kept.
+    """
+    sessionmaker_kw = dict(AsyncSessionTest.kw)
+    async with engine_test.connect() as conn:
+        transaction = await conn.begin()
+        AsyncSessionTest.configure(bind=conn, join_transaction_mode="create_savepoint")
+        try:
+            yield conn
+        finally:
+            AsyncSessionTest.kw = sessionmaker_kw
+            await transaction.rollback()
 
 
 # ------------------------------------------
@@ -83,16 +146,20 @@ async def clean_database():
 
 
 @pytest.fixture
-async def override_get_session() -> AsyncGenerator[AsyncSession, None]:
-    """Provide a test database session."""
+async def session(db_transaction) -> AsyncGenerator[AsyncSession, None]:
+    """Database session for the current test, joined to the per-test transaction.
+
+    The same session is injected into the app, so a test and the requests it
+    makes share one session instead of each opening their own.
+    """
     async with AsyncSessionTest() as session:
         yield session
 
 
 @pytest.fixture(autouse=True)
-def apply_overrides(override_get_session):
+def apply_overrides(session: AsyncSession):
     """Automatically override get_async_session for all tests."""
-    app.dependency_overrides[get_async_session] = lambda: override_get_session
+    app.dependency_overrides[get_async_session] = lambda: session
     yield
     app.dependency_overrides.clear()
 
@@ -110,14 +177,28 @@ def mock_email_sending():
         yield mock
 
 
+@pytest.fixture()
+def background_tasks() -> BackgroundTasks:
+    """Fresh BackgroundTasks for calling route functions directly."""
+    return BackgroundTasks()
+
+
 # ------------------------------------------
 # Sync TestClient (for non-async tests)
 # ------------------------------------------
 
 
+try:
+    import uvloop  # noqa: F401 - installed with uvicorn[standard]
+    USE_UVLOOP = True
+except ImportError:
+    USE_UVLOOP = False
+
+
 @pytest.fixture(scope="session")
 def anyio_backend():
-    return "asyncio"
+    """Run async tests on asyncio only, with uvloop's event loop when available."""
+    return "asyncio", {"use_uvloop": USE_UVLOOP}
 
 
 @pytest.fixture()
@@ -130,58 +211,87 @@ def client() -> Generator:
 # ------------------------------------------
 
 
-@pytest.fixture()
-async def async_client(client) -> AsyncGenerator:
-    transport = ASGITransport(app=app)
-    async with AsyncClient(transport=transport, base_url=client.base_url) as ac:
+TEST_BASE_URL = "http://testserver"
+
+
+@pytest.fixture(scope="session")
+def asgi_transport() -> ASGITransport:
+    """In-process ASGI transport shared by every test client."""
+    return ASGITransport(app=app)
+
+
+@pytest.fixture(scope="session")
+async def async_client(asgi_transport: ASGITransport) -> AsyncGenerator:
+    """HTTP client shared by the whole session; tests are isolated at the DB level."""
+    async with AsyncClient(transport=asgi_transport, base_url=TEST_BASE_URL) as ac:
         yield ac
 
 
-@pytest.fixture()
-async def registered_user(async_client: AsyncClient) -> dict:
-    """Create a test user and return its data."""
-    body = {
-        "id": 123,
-        "email": "test@host.com",
-        "password": "123456"
-    }
-    # Store plain password for tests - register endpoint will hash it
-    plain_password = body["password"]
-    response = await async_client.post("/register", json=body)
-    assert response.status_code == 201
-    # Return body with plain password so tests can use it for authentication
-    body["password"] = plain_password
-    return body
+@pytest.fixture(scope="session")
+async def registered_user(prepare_database) -> dict:
+    """Create the shared test user once per session and return its data.
+
+    The password hash is precomputed; tests get the plain password so they
+    can use it for authentication.
+    """
+    async with AsyncSessionTest() as session:
+        session.add(UserORM(
+            id=REGISTERED_USER["id"],
+            email=REGISTERED_USER["email"],
+            password=REGISTERED_USER_PASSWORD_HASH,
+        ))
+        await session.commit()
+    return dict(REGISTERED_USER)
 
 
 @pytest.fixture()
-async def confirmed_user(registered_user: dict) -> dict:
+async def confirmed_user(registered_user: dict, session: AsyncSession) -> dict:
     print(f"registered_user: {registered_user}")
     query = select(UserORM).where(UserORM.email==registered_user["email"])
-    async with AsyncSessionTest() as session:
-        result = await session.execute(query)
-        user = result.scalar_one_or_none()
-        if user is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Unauthorized, user not found"
-            )
-
-        # Updated confirmation flag
-        user.confirmed = True
-        await session.commit()
+    result = await session.execute(query)
+    user = result.scalar_one_or_none()
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Unauthorized, user not found"
+        )
+
+    # Updated confirmation flag
+    user.confirmed = True
+    await session.commit()
     return registered_user
 
 
 # Authentization
-@pytest.fixture()
-async def logged_in_token(async_client: AsyncClient, confirmed_user: dict) -> str:
-    form_data = {
-        "username": confirmed_user["email"],
-        "password": confirmed_user["password"]
-    }
-    response = await async_client.post("/token", data=form_data)
-    return response.json()["access_token"]
+@pytest.fixture(scope="session")
+async def logged_in_token(registered_user: dict) -> str:
+    """Access token for the registered user, valid for the whole session."""
+    return create_access_token(email=registered_user["email"])
 
 
+@pytest.fixture(scope="session")
+def test_user_id(registered_user: dict) -> int:
+    """Id of the user that auth_headers authenticates as."""
+    return registered_user["id"]
+
 
+@pytest.fixture(scope="session")
+def auth_headers(logged_in_token: str) -> dict[str, str]:
+    """Authorization header for the registered user, built once per session."""
+    return {"Authorization": f"Bearer {logged_in_token}"}
+
+
+@pytest.fixture(scope="session")
+def fake_auth_header() -> dict[str, str]:
+    """Authorization header with a token minted straight from the signing key.
+
+    The subject does not exist in the database, so this only suits requests
+    to endpoints that don't resolve the current user.
+    """
+    expire = datetime.datetime.now(datetime.UTC) + datetime.timedelta(minutes=access_token_expire_minutes())
+    token = jwt.encode(
+        {"sub": "fake@host.com", "type": "access", "exp": expire},
+        key=settings.JWT_SECRET_KEY,
+        algorithm=settings.JWT_ALGORITHM,
+    )
+    return {"Authorization": f"Bearer {token}"}
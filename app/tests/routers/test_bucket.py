@@ -45,24 +45,24 @@ def aiofiles_mock_open(mocker, fs):
     return mock_open
 
 
-async def call_upload_endpoint(async_client: AsyncClient, token: str, sample_image: pathlib.Path):
+async def call_upload_endpoint(async_client: AsyncClient, auth_headers: dict, sample_image: pathlib.Path):
     return await async_client.post("/upload/",
         files={"file": open(sample_image, "rb")},
-        headers={"Authorization": f"Bearer {token}"}
+        headers=auth_headers
     )
 
 
 @pytest.mark.anyio
-async def test_upload_image(async_client: AsyncClient, logged_in_token: str, sample_image: pathlib.Path):
-    response = await call_upload_endpoint(async_client, logged_in_token, sample_image)
+async def test_upload_image(async_client: AsyncClient, auth_headers: dict, sample_image: pathlib.Path):
+    response = await call_upload_endpoint(async_client, auth_headers, sample_image)
     assert response.status_code == 201
     assert response.json()["file_url"] == "https://fakeurl.com"
 
 
 @pytest.mark.anyio
-async def test_temp_file_removed_after_uploading(async_client: AsyncClient, logged_in_token: str, sample_image: pathlib.Path, mocker):
+async def test_temp_file_removed_after_uploading(async_client: AsyncClient, auth_headers: dict, sample_image: pathlib.Path, mocker):
     named_temp_file_spy = mocker.spy(tempfile, "NamedTemporaryFile")
-    response = await call_upload_endpoint(async_client, logged_in_token, sample_image)
+    response = await call_upload_endpoint(async_client, auth_headers, sample_image)
     assert response.status_code == 201
 
     created_temp_file = named_temp_file_spy.spy_return.name
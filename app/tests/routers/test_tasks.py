@@ -1 +1,35 @@
+import httpx
+import pytest
 
+from app.core import tasks
+from app.core.config import settings
+
+
+@pytest.fixture()
+def mailgun_requests(monkeypatch) -> list[httpx.Request]:
+    """Route the shared HTTP client to a mock Mailgun and record the requests."""
+    sent: list[httpx.Request] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        sent.append(request)
+        return httpx.Response(200, json={"id": "<message-id>", "message": "Queued"})
+
+    monkeypatch.setattr(settings, "MAILGUN_API_KEY", "test-key")
+    monkeypatch.setattr(settings, "MAILGUN_DOMAIN", "mg.example.com")
+    monkeypatch.setattr(tasks, "_http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    return sent
+
+
+@pytest.mark.anyio
+async def test_send_simple_message_reuses_shared_client(mailgun_requests: list[httpx.Request]):
+    client = tasks.get_http_client()
+    for _ in range(2):
+        result = await tasks.send_simple_message(to="test@host.com", subject="Hi", body="Hello")
+        assert result["id"] == "<message-id>"
+
+    assert tasks.get_http_client() is client
+    assert len(mailgun_requests) == 2
+    assert mailgun_requests[0].url == "https://api.mailgun.net/v3/mg.example.com/messages"
+
+    await tasks.close_http_client()
+    assert client.is_closed
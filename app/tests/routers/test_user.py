@@ -1,15 +1,19 @@
+import functools
+import hashlib
 import logging
+import time
 from typing import AsyncGenerator
+import bcrypt
 import pytest
 from httpx import AsyncClient
 from fastapi import status, HTTPException, Request, BackgroundTasks
-from jose import jwt
+import jwt
 
 from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.routers.user import get_user, register, create_access_token, get_password_hash, verify_password, get_current_user, authenticate_user, create_confirmation_token, get_subject_for_token_type
 from app.routers import user as user_router
-from app.tests.conftest import AsyncSessionTest
 from app.entities.models import User as UserORM
 from app.entities.schemas import UserIn
 from app.core.config import settings, access_token_expire_minutes, confirm_token_expire_minutes
@@ -17,14 +21,31 @@ from app.core.config import settings, access_token_expire_minutes, confirm_token
 
 logger = logging.getLogger(__name__)
 
+# Hash of "password", computed once for the tests that only verify against it
+HASHED_PASSWORD = get_password_hash("password")
+
+# Tokens shared by the read-only token tests
+TOKEN_EMAIL = "test@gmail.com"
+ACCESS_TOKEN = create_access_token(email=TOKEN_EMAIL)
+CONFIRMATION_TOKEN = create_confirmation_token(email=TOKEN_EMAIL)
+
+
+@functools.lru_cache(maxsize=256)
+def _decode(token: str) -> dict:
+    """Decode a token with the app's signing settings, once per token.
+
+    The returned dict is shared between callers; copy it before mutating.
+    """
+    return jwt.decode(token, key=settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
+
 
 # User Tests
 @pytest.mark.anyio
-async def test_create_user(async_client: AsyncClient):
+async def test_create_user(async_client: AsyncClient, session: AsyncSession):
     """Test creating a new post."""
     body = {
-        "id": 123,
-        "email": "test@host.com",
+        "id": 456,
+        "email": "new@host.com",
         "password": "123456"
     }
     response = await async_client.post("/register", json=body)
@@ -34,42 +55,80 @@ async def test_create_user(async_client: AsyncClient):
     assert "id" in data
     assert isinstance(data["id"], int)
 
+    user = await get_user(session, email=body["email"])
+    assert verify_password(body["password"], user.password)
+
 
 @pytest.mark.anyio
-async def test_get_user(async_client: AsyncClient, confirmed_user: dict):
-    async with AsyncSessionTest() as session:
-        user = await get_user(session, email=confirmed_user["email"])
-        print(f"confirmed_user: {confirmed_user}")
-        assert user.email == confirmed_user["email"]
+async def test_get_users(async_client: AsyncClient, registered_user: dict):
+    response = await async_client.get("/users")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == [{"id": registered_user["id"], "email": registered_user["email"]}]
 
 
 @pytest.mark.anyio
-async def test_get_user_not_found(async_client: AsyncClient, confirmed_user: dict):
-    async with AsyncSessionTest() as session:
-        user = await get_user(session, email="test@example.com")
-        assert user is None
+async def test_get_user(confirmed_user: dict, session: AsyncSession):
+    user = await get_user(session, email=confirmed_user["email"])
+    print(f"confirmed_user: {confirmed_user}")
+    assert user.email == confirmed_user["email"]
+
 
 @pytest.mark.anyio
-async def test_register_user_already_exists(async_client: AsyncClient, confirmed_user: dict):
+async def test_get_user_not_found(registered_user: dict, session: AsyncSession):
+    user = await get_user(session, email="test@example.com")
+    assert user is None
+
+
+@pytest.mark.anyio
+async def test_register_user_already_exists(async_client: AsyncClient, confirmed_user: dict, mocker):
+    hash_spy = mocker.spy(user_router, "get_password_hash")
     response = await async_client.post("/register", json=confirmed_user)
     assert response.status_code == status.HTTP_400_BAD_REQUEST
     assert "already existed" in response.json()["detail"]
+    # Duplicates are rejected before the password is hashed
+    assert hash_spy.call_count == 0
+
+
+@pytest.mark.anyio
+async def test_register_user_duplicate_id(async_client: AsyncClient, registered_user: dict):
+    body = {**registered_user, "email": "other@host.com"}
+    response = await async_client.post("/register", json=body)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json()["detail"] == f"User with id already existed: {registered_user['id']}"
 
 
 @pytest.mark.anyio
-async def test_confirm_user(async_client: AsyncClient, mocker):
-    # spy = mocker.spy(Request, "url_for")
-    spy = mocker.spy(user_router, "send_user_registration_email")
+async def test_register_user_already_exists_race(confirmed_user: dict, request: Request, session: AsyncSession, background_tasks: BackgroundTasks, mocker):
+    # Simulate another request inserting the email after the existence check
+    mocker.patch.object(session, "scalar", return_value=None)
+    user = UserIn.model_validate({**confirmed_user, "id": 456})
+    with pytest.raises(HTTPException) as exc:
+        await register(user=user, background_tasks=background_tasks, session=session, request=request)
+    assert exc.value.status_code == status.HTTP_400_BAD_REQUEST
+    assert "already existed" in exc.value.detail
+    assert confirmed_user["email"] in exc.value.detail
 
+
+@pytest.mark.anyio
+async def test_register_user_email_case_insensitive(async_client: AsyncClient, registered_user: dict, session: AsyncSession):
+    body = {**registered_user, "id": 456, "email": f" {registered_user['email'].upper()} "}
+    response = await async_client.post("/register", json=body)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    user = await get_user(session, email=registered_user["email"].upper())
+    assert user.email == registered_user["email"]
+
+
+@pytest.mark.anyio
+async def test_confirm_user(async_client: AsyncClient, mock_email_sending):
     body = {
-        "id": 123,
-        "email": "test@host.com",
+        "id": 456,
+        "email": "new@host.com",
         "password": "123456"
     }
     response = await async_client.post("/register", json=body)
 
-    # confirmation_url = str(spy.spy_return)
-    confirmation_url = str(spy.call_args[1]["confirmation_url"])
+    confirmation_url = str(mock_email_sending.call_args.kwargs["confirmation_url"])
     print(f"confirmation_url: {confirmation_url}")
     response1 = await async_client.get(confirmation_url)
 
@@ -77,29 +136,44 @@ async def test_confirm_user(async_client: AsyncClient, mocker):
     assert "User confirmed" == response1.json().get("detail")
 
 
+@pytest.mark.anyio
+async def test_confirm_user_mixed_case_token(async_client: AsyncClient, registered_user: dict, session: AsyncSession):
+    token = create_confirmation_token(email=f" {registered_user['email'].upper()} ")
+    response = await async_client.get(f"/confirm/{token}")
+    assert response.status_code == status.HTTP_200_OK
+
+    user = await get_user(session, email=registered_user["email"])
+    assert user.confirmed
+
+
 @pytest.mark.anyio
 async def test_confirm_user_invalid_token(async_client: AsyncClient):
     response = await async_client.get("/confirm/invalid-token")
     assert response.status_code == 401
 
 
+@pytest.mark.anyio
+async def test_confirm_user_not_found(async_client: AsyncClient):
+    token = create_confirmation_token(email="missing@host.com")
+    response = await async_client.get(f"/confirm/{token}")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert "missing@host.com" in response.json()["detail"]
+
+
 @pytest.mark.anyio
 async def test_confirm_user_expired_token(async_client: AsyncClient, mocker):
     # Patch token expiry duration so generated token is already expired
     mocker.patch("app.routers.user.confirm_token_expire_minutes", return_value=-1)
 
-    # Spy on *instance method*
-    spy = mocker.spy(Request, "url_for")
-
     body = {
-        "id": 123,
-        "email": "test@host.com",
+        "id": 456,
+        "email": "new@host.com",
         "password": "123456"
     }
     response = await async_client.post("/register", json=body)
     assert response.status_code == 201
 
-    confirmation_url = response.json()["confirmation_url"]  # str(spy.spy_return)
+    confirmation_url = response.json()["confirmation_url"]
     print(f"confirmation_url: {confirmation_url}")
     response1 = await async_client.get(confirmation_url)
     assert response1.status_code == 401
@@ -109,24 +183,46 @@ async def test_confirm_user_expired_token(async_client: AsyncClient, mocker):
 
 
 @pytest.mark.anyio
-async def test_register_user_already_exists_direct(async_client: AsyncClient, confirmed_user: dict, request: Request):
-    async with AsyncSessionTest() as session:
-        background_tasks = BackgroundTasks()
-        with pytest.raises(HTTPException) as exc:
-            await register(user=UserIn.model_validate(confirmed_user), background_tasks=background_tasks, session=session, request=request)
-        assert exc.value.status_code == 400
+async def test_register_user_already_exists_direct(confirmed_user: dict, request: Request, session: AsyncSession, background_tasks: BackgroundTasks):
+    with pytest.raises(HTTPException) as exc:
+        await register(user=UserIn.model_validate(confirmed_user), background_tasks=background_tasks, session=session, request=request)
+    assert exc.value.status_code == 400
 
 
 @pytest.mark.anyio
 async def test_password_hashes():
-    password = "password"
-    assert verify_password(password, get_password_hash(password))
+    assert verify_password("password", HASHED_PASSWORD)
+
+
+@pytest.mark.anyio
+async def test_password_hash_uses_salt_pool():
+    await user_router.refill_salt_pool()
+    assert len(user_router._salt_pool) == user_router.SALT_POOL_SIZE
+
+    hashed_password = get_password_hash("password")
+    assert len(user_router._salt_pool) == user_router.SALT_POOL_SIZE - 1
+    assert verify_password("password", hashed_password)
+
+
+@pytest.mark.anyio
+async def test_verify_password_cache(mocker):
+    user_router.clear_verify_cache()
+    verify_spy = mocker.spy(user_router, "_verify_hash")
+
+    assert verify_password("password", HASHED_PASSWORD)
+    assert verify_password("password", HASHED_PASSWORD)
+    assert verify_spy.call_count == 1
+
+    # Failed checks are never cached
+    assert not verify_password("wrong password", HASHED_PASSWORD)
+    assert not verify_password("wrong password", HASHED_PASSWORD)
+    assert verify_spy.call_count == 3
 
 
 @pytest.mark.anyio
 async def test_login_user_not_exists(async_client: AsyncClient):
     form_data = {
-        "username": "test@host.com",
+        "username": "missing@host.com",
         "password": "123456"
     }
     response = await async_client.post("/token", data=form_data)
@@ -156,139 +252,126 @@ async def test_login_user_not_confirmed(async_client: AsyncClient, registered_us
 
 
 @pytest.mark.anyio
-async def test_create_access_token():
-    email = "test@email.com"
-    token = create_access_token(email=email)
-    assert {"sub": email, "type": "access"}.items() <= jwt.decode(
-        token,
-        key=settings.JWT_SECRET_KEY,
-        algorithms=[settings.JWT_ALGORITHM]).items()
-
-
-@pytest.mark.anyio
-async def test_create_confirmation_token():
-    email = "test@email.com"
-    token = create_confirmation_token(email=email)
-    assert {"sub": email, "type": "confirmation"}.items() <= jwt.decode(
-        token,
-        key=settings.JWT_SECRET_KEY,
-        algorithms=[settings.JWT_ALGORITHM]).items()
+@pytest.mark.parametrize(
+    "token_type, token",
+    [
+        pytest.param("access", ACCESS_TOKEN, id="access"),
+        pytest.param("confirmation", CONFIRMATION_TOKEN, id="confirmation"),
+    ]
+)
+async def test_token_payload_and_subject(token_type: str, token: str):
+    assert {"sub": TOKEN_EMAIL, "type": token_type}.items() <= _decode(token).items()
+    assert TOKEN_EMAIL == get_subject_for_token_type(token=token, payload_type=token_type)
 
 
 @pytest.mark.anyio
-async def test_get_subject_for_token_type_valid_access():
-    email = "test@gmail.com"
+async def test_get_subject_for_token_type_cached(mocker):
+    email = "cached@gmail.com"
     token = create_access_token(email=email)
-    assert email == get_subject_for_token_type(token=token, payload_type="access")
-
+    decode_spy = mocker.spy(user_router.jwt, "decode")
 
-@pytest.mark.anyio
-async def test_get_subject_for_token_type_valid_confirmation():
-    email = "test@gmail.com"
-    token = create_confirmation_token(email=email)
-    assert email == get_subject_for_token_type(token=token, payload_type="confirmation")
-
-@pytest.mark.anyio
-async def test_get_subject_for_token_type_expired(mocker):
-    mocker.patch("app.routers.user.access_token_expire_minutes", return_value=-1)
-    email = "test@gmail.com"
-    token = create_access_token(email)
-    with pytest.raises(HTTPException) as exc:  # ExpiredSignatureError
-        get_subject_for_token_type(token, "access")
-    assert "Unauthorized, Token has expired" == exc.value.detail
-
-
-@pytest.mark.anyio
-async def test_get_subject_for_token_type_invalid_token():
-    token = "invalid-token"
-    with pytest.raises(HTTPException) as exc:  # JWTError
-        get_subject_for_token_type(token, "access")
-    assert f"Unauthorized, invalid token with token: {token}" == exc.value.detail
+    assert email == get_subject_for_token_type(token=token, payload_type="access")
+    assert email == get_subject_for_token_type(token=token, payload_type="access")
+    assert decode_spy.call_count == 1
 
+    # The token type is still checked for cached tokens
+    with pytest.raises(HTTPException) as exc:
+        get_subject_for_token_type(token=token, payload_type="confirmation")
+    assert exc.value.status_code == status.HTTP_401_UNAUTHORIZED
 
-@pytest.mark.anyio
-async def test_get_subject_for_token_type_missing_sub():
-    email = "test@gmail.com"
-    token = create_access_token(email)
-    payload = jwt.decode(
-        token,
-        key=settings.JWT_SECRET_KEY,
-        algorithms=[settings.JWT_ALGORITHM]
-    )
-    del payload["sub"]
-    token_missing_sub = jwt.encode(
-        payload,
-        key=settings.JWT_SECRET_KEY,
-        algorithm=settings.JWT_ALGORITHM
-    )
-
-    # simple unittest
-    # exp = int(time.time()) + 3600
-    # payload = {"exp": exp, "type": "access"}
 
-    with pytest.raises(HTTPException) as exc:
-        get_subject_for_token_type(token_missing_sub, "access")
-    assert "Unauthorized, cannot get sub" == exc.value.detail
+def _encode(payload: dict) -> str:
+    """Sign an arbitrary payload with the app's signing settings."""
+    return jwt.encode(payload, key=settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
 
 
 @pytest.mark.anyio
-async def test_get_subject_for_token_type_wrong_type():
-    email = "test@gmail.com"
-    token = create_confirmation_token(email)
+@pytest.mark.parametrize(
+    "token, detail",
+    [
+        pytest.param(
+            _encode({"sub": TOKEN_EMAIL, "type": "access", "exp": int(time.time()) - 60}),
+            "Unauthorized, Token has expired",
+            id="expired",
+        ),
+        pytest.param(
+            "invalid-token",
+            "Unauthorized, invalid token with token: invalid-token",
+            id="invalid_token",
+        ),
+        pytest.param(
+            _encode({"type": "access", "exp": int(time.time()) + 3600}),
+            "Unauthorized, cannot get sub",
+            id="missing_sub",
+        ),
+        pytest.param(
+            CONFIRMATION_TOKEN,
+            "Unauthorized, not accept token type=confirmation; payload type=access",
+            id="wrong_type",
+        ),
+    ]
+)
+async def test_get_subject_for_token_type_errors(token: str, detail: str):
     with pytest.raises(HTTPException) as exc:
         get_subject_for_token_type(token, "access")
-    token_type = "confirmation"
-    payload_type = "access"
-    assert f"Unauthorized, not accept token type={token_type}; payload type={payload_type}" == exc.value.detail
+    assert exc.value.status_code == status.HTTP_401_UNAUTHORIZED
+    assert detail == exc.value.detail
 
 
 @pytest.mark.anyio
-async def test_get_current_user_wrong_type_token(async_client: AsyncClient, confirmed_user: dict):
+async def test_get_current_user_wrong_type_token(confirmed_user: dict, session: AsyncSession):
     # Create token with type="confirmation"
     token = create_confirmation_token(email=confirmed_user["email"])
-    async with AsyncSessionTest() as session:
-        with pytest.raises(HTTPException) as exc:
-            # try to access with 'confirmation' token
-            await get_current_user(session=session, token=token)
-        assert exc.value.status_code == 401  # Not authentication
+    with pytest.raises(HTTPException) as exc:
+        # try to access with 'confirmation' token
+        await get_current_user(session=session, token=token)
+    assert exc.value.status_code == 401  # Not authentication
 
 
 @pytest.mark.anyio
-async def test_authenticate_user(confirmed_user: dict):
-    async with AsyncSessionTest() as session:
-        user_result = await authenticate_user(session=session, email=confirmed_user["email"], password=confirmed_user["password"])
-        assert user_result.email == confirmed_user["email"]
+async def test_authenticate_user(confirmed_user: dict, session: AsyncSession):
+    user_result = await authenticate_user(session=session, email=confirmed_user["email"], password=confirmed_user["password"])
+    assert user_result.email == confirmed_user["email"]
 
 
 @pytest.mark.anyio
-async def test_authenticate_user_not_found():
-    async with AsyncSessionTest() as session:
-        with pytest.raises(HTTPException) as exc:
-            await authenticate_user(session=session, email="test@home.com", password="123456")
-        assert exc.value.status_code == status.HTTP_401_UNAUTHORIZED
-        assert "1-Unauthorized" in exc.value.detail
+@pytest.mark.parametrize(
+    "email, password, detail",
+    [
+        pytest.param("test@home.com", "123456", "1-Unauthorized", id="not_found"),
+        # None stands for the confirmed user's email
+        pytest.param(None, "wrong password", "2-Unauthorized", id="wrong_password"),
+    ]
+)
+async def test_authenticate_user_failures(confirmed_user: dict, session: AsyncSession, email: str | None, password: str, detail: str):
+    with pytest.raises(HTTPException) as exc:
+        await authenticate_user(session=session, email=email or confirmed_user["email"], password=password)
+    assert exc.value.status_code == status.HTTP_401_UNAUTHORIZED
+    assert detail in exc.value.detail
 
 @pytest.mark.anyio
-async def test_authenticate_user_wrong_password(confirmed_user: dict):
-    async with AsyncSessionTest() as session:
-        with pytest.raises(HTTPException) as exc:
-            await authenticate_user(session=session, email=confirmed_user["email"], password="wrong password")
-        assert exc.value.status_code == status.HTTP_401_UNAUTHORIZED
-        assert "2-Unauthorized" in exc.value.detail
+async def test_authenticate_user_rehashes_bcrypt_password(confirmed_user: dict, session: AsyncSession):
+    sha = hashlib.sha256(confirmed_user["password"].encode("utf-8")).digest()
+    bcrypt_hash = bcrypt.hashpw(sha, bcrypt.gensalt(rounds=4)).decode()
+    user = await get_user(session, email=confirmed_user["email"])
+    user.password = bcrypt_hash
+    await session.commit()
+
+    await authenticate_user(session=session, email=confirmed_user["email"], password=confirmed_user["password"])
+    user = await get_user(session, email=confirmed_user["email"])
+    assert user.password.startswith("$argon2id$")
+    assert verify_password(confirmed_user["password"], user.password)
 
 @pytest.mark.anyio
-async def test_get_current_user(confirmed_user: dict):
-    token = create_access_token(email=confirmed_user["email"])
-    async with AsyncSessionTest() as session:
-        user = await get_current_user(session=session, token=token)
-        assert user.email == confirmed_user["email"]
+async def test_get_current_user(confirmed_user: dict, logged_in_token: str, session: AsyncSession):
+    user = await get_current_user(session=session, token=logged_in_token)
+    assert user.email == confirmed_user["email"]
 
 @pytest.mark.anyio
-async def test_get_current_user_invalid_token():
-    async with AsyncSessionTest() as session:
-        with pytest.raises(HTTPException) as exc:
-            await get_current_user(session=session, token="invalid-token")
-        assert exc.value.status_code == status.HTTP_401_UNAUTHORIZED
+async def test_get_current_user_invalid_token(session: AsyncSession):
+    with pytest.raises(HTTPException) as exc:
+        await get_current_user(session=session, token="invalid-token")
+    assert exc.value.status_code == status.HTTP_401_UNAUTHORIZED
 
 
 @pytest.mark.anyio